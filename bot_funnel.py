@@ -4,129 +4,282 @@ Telegram Bot для автоматической персонализирова
 с поддержкой профилей брендинга и A/B-тестирования
 """
 
+from __future__ import annotations
+
 import asyncio
 import argparse
+import logging
 import os
+import queue
 import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
-from aiogram import Bot
-from aiogram.types import FSInputFile
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+log = logging.getLogger(__name__)
+
+
+def _import_runtime():
+    """
+    Импортирует тяжелые зависимости (numpy, aiogram, рендеринг)
+    после разбора аргументов CLI: --help и --list-profiles не платят
+    сотни миллисекунд за их загрузку.
+    """
+    global np, Bot, FSInputFile, InputMediaPhoto
+    global TelegramBadRequest, TelegramForbiddenError
+    global load_users, render_html, html_to_png, get_keyboard
+    global STAGES, SEND_DELAY, SEND_CONCURRENCY, VARIANTS
+    global CompiledProfile, compile_profile, load_profile, get_token
+
+    import numpy as np
+    from aiogram import Bot
+    from aiogram.types import FSInputFile, InputMediaPhoto
+    from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+    from utils import (
+        load_users, render_html, html_to_png, get_keyboard
+    )
+    from config import (
+        STAGES, SEND_DELAY, SEND_CONCURRENCY, VARIANTS,
+        CompiledProfile, compile_profile, load_profile, get_token
+    )
+
+
+def _setup_logging() -> QueueListener:
+    """
+    Настраивает буферизованное логирование через очередь: записи уходят
+    в QueueHandler без блокировки, фоновый QueueListener пишет их в stdout.
+    Убирает конкуренцию корутин за stdio-лок в горячем цикле.
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = QueueListener(log_queue, handler)
+    # force=True: перекрываем хендлеры, которые могли добавить библиотеки
+    logging.basicConfig(level=logging.INFO, format='%(message)s',
+                        handlers=[QueueHandler(log_queue)], force=True)
+    listener.start()
+    return listener
+
+
+async def _process_group(bot: Bot, user_data: dict, chat_ids: list, variant: str,
+                         output_dir: str, send_real: bool, profile: dict,
+                         semaphore: asyncio.Semaphore,
+                         png_cache: dict, file_id_cache: dict,
+                         render_pool: ProcessPoolExecutor = None) -> int:
+    """
+    Обрабатывает группу пользователей с одинаковой персоной
+    (name, role, company, variant): каждый этап рендерится один раз,
+    затем готовый PNG рассылается всем получателям группы.
+    CPU-тяжелая конвертация HTML→PNG выполняется в пуле процессов, чтобы
+    не блокировать event loop и параллельные отправки.
+    Этапы без клавиатуры уходят одним sendMediaGroup (один HTTPS
+    round-trip вместо трех), последний этап — send_photo с кнопкой.
+    Отправка ограничена семафором, чтобы не превысить лимиты Telegram.
+    Уже загруженные в Telegram изображения переиспользуются по file_id.
+
+    Returns:
+        int: Количество успешно обработанных сообщений
+    """
+    processed = 0
+
+    # Сырой dict для пула процессов: замыкания CompiledProfile не пиклятся
+    raw_profile = profile.raw if isinstance(profile, CompiledProfile) else profile
+
+    # Статусы этапов копим в список и логируем одной записью на группу
+    ids_str = ', '.join(str(c) for c in chat_ids)
+    lines = [f"\n👤 {user_data['name']} (ID: {ids_str}, вариант: {variant.upper()})"]
+
+    # Фаза 1: рендерим все этапы группы
+    stage_paths = {}
+    for stage in STAGES:
+        try:
+            # Контент баннера зависит только от этапа, варианта и персоны —
+            # рендерим один раз на группу (плюс кэш между группами)
+            cache_key = (stage, variant, user_data['name'],
+                         user_data['role'], user_data['company'])
+            png_path = png_cache.get(cache_key)
+
+            if png_path is None:
+                # Рендерим HTML с учетом варианта и профиля
+                html_content = render_html(stage, variant, user_data, profile)
+
+                # Конвертируем в PNG; рендер уходит в пул процессов,
+                # event loop продолжает диспетчеризацию отправок
+                if render_pool is not None:
+                    loop = asyncio.get_running_loop()
+                    png_path = await loop.run_in_executor(
+                        render_pool, html_to_png,
+                        html_content, f"{stage}_{variant}", chat_ids[0],
+                        output_dir, user_data, raw_profile
+                    )
+                else:
+                    png_path = html_to_png(
+                        html_content,
+                        f"{stage}_{variant}",
+                        chat_ids[0],
+                        output_dir,
+                        user_data,
+                        raw_profile
+                    )
+                png_cache[cache_key] = png_path
+
+            stage_paths[stage] = png_path
+
+        except Exception as e:
+            lines.append(f"   ❌ Ошибка при обработке {stage}_{variant}: {e}")
+            continue
+
+    # Фаза 2: рассылаем готовые PNG получателям группы
+    if not send_real:
+        for chat_id in chat_ids:
+            for png_path in stage_paths.values():
+                lines.append(f"   📸 Сгенерирован: {Path(png_path).name}")
+                processed += 1
+
+        log.info("\n".join(lines))
+        return processed
+
+    # sendMediaGroup принимает 2–10 медиа; клавиатура нужна на последнем
+    # этапе, поэтому альбомом уходят все этапы кроме него (если их >= 2)
+    stages = list(stage_paths)
+    album_stages = stages[:-1] if len(stages) >= 3 else []
+    single_stages = stages[len(album_stages):]
+
+    for chat_id in chat_ids:
+        async with semaphore:
+            try:
+                if album_stages:
+                    # Если файлы уже загружались — отправляем по file_id,
+                    # экономя повторную загрузку байтов
+                    media = [
+                        InputMediaPhoto(media=file_id_cache.get(stage_paths[s])
+                                        or FSInputFile(stage_paths[s]))
+                        for s in album_stages
+                    ]
+                    messages = await bot.send_media_group(chat_id=chat_id, media=media)
+                    for s, message in zip(album_stages, messages):
+                        if message.photo:
+                            file_id_cache[stage_paths[s]] = message.photo[-1].file_id
+                    lines.append(f"   ✅ Отправлен альбом: {', '.join(album_stages)} → {chat_id}")
+                    processed += len(album_stages)
+
+                for stage in single_stages:
+                    png_path = stage_paths[stage]
+                    # Клавиатура персональная — URL содержит ID получателя
+                    keyboard = get_keyboard(stage, chat_id, user_data['name'], profile)
+                    photo = file_id_cache.get(png_path) or FSInputFile(png_path)
+                    message = await bot.send_photo(
+                        chat_id=chat_id,
+                        photo=photo,
+                        reply_markup=keyboard
+                    )
+                    if message.photo:
+                        file_id_cache[png_path] = message.photo[-1].file_id
+                    lines.append(f"   ✅ Отправлено: {stage}_{variant} → {chat_id}")
+                    processed += 1
+
+            except TelegramBadRequest as e:
+                lines.append(f"   ❌ Ошибка: {e}")
+            except TelegramForbiddenError:
+                lines.append(f"   ❌ Пользователь заблокировал бота")
+            except Exception as e:
+                lines.append(f"   ❌ Неожиданная ошибка: {e}")
+
+            # Задержка между получателями (внутри семафора — удерживает
+            # общий темп на уровне SEND_CONCURRENCY / SEND_DELAY)
+            await asyncio.sleep(SEND_DELAY)
 
-from utils import (
-    load_users, render_html, html_to_png, get_keyboard, 
-    get_random_variant, list_available_profiles
-)
-from config import (
-    BOT_TOKEN, STAGES, SEND_DELAY, VARIANTS, 
-    load_profile, AVAILABLE_PROFILES
-)
+    log.info("\n".join(lines))
+    return processed
 
 
-async def send_funnel(bot: Bot, users_df, output_dir: str, send_real: bool = False, 
-                      variant_mode: str = 'fixed', profile: dict = None):
+async def send_funnel(bot: Bot, users: list, output_dir: str, send_real: bool = False,
+                      variant_mode: str = 'fixed', profile: dict = None,
+                      render_pool: ProcessPoolExecutor = None):
     """
     Отправляет персонализированную воронку пользователям с поддержкой A/B-тестирования
     и кастомного брендинга.
-    
+
     Args:
         bot: Экземпляр Telegram бота
-        users_df: DataFrame с пользователями
+        users: Список пользователей (dict с name/role/company/telegram_id/variant)
         output_dir: Директория для сохранения PNG
         send_real: Отправлять ли реальные сообщения
         variant_mode: Режим выбора вариантов (fixed/random)
         profile: Профиль брендинга
+        render_pool: Пул процессов для HTML→PNG рендеринга
     """
-    brand_name = profile.get('brand', {}).get('name', 'Unknown') if profile else 'Default'
-    
-    print(f"\n{'='*60}")
-    print(f"🚀 Запуск воронки анонсов")
-    print(f"{'='*60}")
-    print(f"📊 Пользователей: {len(users_df)}")
-    print(f"📝 Режим: {'Отправка' if send_real else 'Тестирование (генерация PNG)'}")
-    print(f"🎯 Варианты: {variant_mode}")
-    print(f"🎨 Бренд: {brand_name}")
-    print(f"{'='*60}\n")
-    
-    total_messages = len(users_df) * len(STAGES)
-    processed = 0
-    variant_stats = {'a': 0, 'b': 0, 'c': 0}
-    
-    for _, row in users_df.iterrows():
+    raw_profile = profile.raw if isinstance(profile, CompiledProfile) else profile
+    brand_name = raw_profile.get('brand', {}).get('name', 'Unknown') if raw_profile else 'Default'
+
+    log.info(f"\n{'='*60}")
+    log.info(f"🚀 Запуск воронки анонсов")
+    log.info(f"{'='*60}")
+    log.info(f"📊 Пользователей: {len(users)}")
+    log.info(f"📝 Режим: {'Отправка' if send_real else 'Тестирование (генерация PNG)'}")
+    log.info(f"🎯 Варианты: {variant_mode}")
+    log.info(f"🎨 Бренд: {brand_name}")
+    log.info(f"{'='*60}\n")
+
+    total_messages = len(users) * len(STAGES)
+
+    if variant_mode == 'random':
+        # Один векторизованный вызов RNG вместо вызова на каждого пользователя
+        rng = np.random.default_rng()
+        variants = rng.choice(VARIANTS, size=len(users))
+    else:
+        variants = [user.get('variant', 'a') for user in users]
+
+    # Пользователи обрабатываются конкурентно: HTTP-запросы перекрываются,
+    # а семафор удерживает количество одновременных отправок в рамках лимитов.
+    # Одинаковые персоны схлопываются в одну группу — рендер на группу один.
+    semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+    png_cache = {}      # (stage, variant, name, role, company) -> путь к PNG
+    file_id_cache = {}  # путь к PNG -> Telegram file_id
+    tasks = []
+    task_variants = []
+
+    groups = {}
+    for user, variant in zip(users, variants):
+        key = (user['name'], user['role'], user['company'], variant)
+        groups.setdefault(key, []).append(int(user['telegram_id']))
+
+    for (name, role, company, variant), chat_ids in groups.items():
         user_data = {
-            'name': row['name'],
-            'role': row['role'],
-            'company': row['company']
+            'name': name,
+            'role': role,
+            'company': company
         }
-        chat_id = row['telegram_id']
-        
-        # Определяем вариант для пользователя
-        if variant_mode == 'random':
-            variant = get_random_variant()
-        else:
-            variant = row.get('variant', 'a')
-        
-        print(f"\n👤 {user_data['name']} (ID: {chat_id}, вариант: {variant.upper()})")
-        
-        for stage in STAGES:
-            try:
-                # Рендерим HTML с учетом варианта и профиля
-                html_content = render_html(stage, variant, user_data, profile)
-                
-                # Конвертируем в PNG с уникальным именем
-                png_path = html_to_png(
-                    html_content, 
-                    f"{stage}_{variant}", 
-                    chat_id, 
-                    output_dir, 
-                    user_data,
-                    profile
-                )
-                
-                if send_real:
-                    # Отправляем через бота
-                    keyboard = get_keyboard(stage, chat_id, user_data['name'], profile)
-                    
-                    try:
-                        await bot.send_photo(
-                            chat_id=chat_id,
-                            photo=FSInputFile(png_path),
-                            reply_markup=keyboard
-                        )
-                        print(f"   ✅ Отправлено: {stage}_{variant}")
-                        
-                    except TelegramBadRequest as e:
-                        print(f"   ❌ Ошибка: {e}")
-                    except TelegramForbiddenError as e:
-                        print(f"   ❌ Пользователь заблокировал бота")
-                    except Exception as e:
-                        print(f"   ❌ Неожиданная ошибка: {e}")
-                    
-                    # Задержка между отправками
-                    await asyncio.sleep(SEND_DELAY)
-                else:
-                    print(f"   📸 Сгенерирован: {Path(png_path).name}")
-                
-                # Статистика вариантов
-                variant_stats[variant] += 1
-                processed += 1
-                
-            except Exception as e:
-                print(f"   ❌ Ошибка при обработке {stage}_{variant}: {e}")
-                continue
-    
+
+        task_variants.extend([variant] * len(chat_ids))
+        tasks.append(_process_group(
+            bot, user_data, chat_ids, variant,
+            output_dir, send_real, profile, semaphore,
+            png_cache, file_id_cache, render_pool
+        ))
+
+    processed_counts = await asyncio.gather(*tasks)
+    processed = int(sum(processed_counts))
+
+    # Статистика вариантов одним проходом Counter вместо инкрементов
+    # словаря на каждое сообщение
+    variant_stats = {v: n * len(STAGES)
+                     for v, n in Counter(task_variants).items()}
+
+
     # Итоговая статистика
-    print(f"\n{'='*60}")
-    print(f"🎉 Обработка завершена!")
-    print(f"{'='*60}")
-    print(f"📊 Обработано сообщений: {processed}/{total_messages}")
-    print(f"📈 Статистика вариантов:")
+    log.info(f"\n{'='*60}")
+    log.info(f"🎉 Обработка завершена!")
+    log.info(f"{'='*60}")
+    log.info(f"📊 Обработано сообщений: {processed}/{total_messages}")
+    log.info(f"📈 Статистика вариантов:")
     for v, count in variant_stats.items():
         if count > 0:
-            print(f"   Вариант {v.upper()}: {count} сообщений")
-    print(f"📁 PNG сохранены в: {output_dir}/")
-    print(f"{'='*60}\n")
+            log.info(f"   Вариант {v.upper()}: {count} сообщений")
+    log.info(f"📁 PNG сохранены в: {output_dir}/")
+    log.info(f"{'='*60}\n")
 
 
 async def main():
@@ -157,8 +310,9 @@ async def main():
     
     args = parser.parse_args()
     
-    # Показать список профилей
+    # Показать список профилей (без загрузки тяжелых зависимостей)
     if args.list_profiles:
+        from config import list_available_profiles
         print("\n📋 Доступные профили брендинга:\n")
         profiles = list_available_profiles()
         for p in profiles:
@@ -174,7 +328,10 @@ async def main():
             print(f"  {emoji} {p}")
         print(f"\nИспользование: python3 bot_funnel.py --test --brand <профиль>\n")
         return
-    
+
+    # Дальше понадобится весь рантайм — загружаем тяжелые зависимости
+    _import_runtime()
+
     # Определяем режим работы
     if args.send:
         send_real = True
@@ -185,11 +342,12 @@ async def main():
     
     print(f"\n🚀 Запуск в режиме {mode}")
     
-    # Загружаем профиль
-    profile = load_profile(args.brand)
+    # Загружаем и компилируем профиль: горячие поля вычисляются один раз
+    profile = compile_profile(load_profile(args.brand))
     
     # Проверяем токен бота
-    if not BOT_TOKEN:
+    bot_token = get_token()
+    if not bot_token:
         print("❌ Ошибка: BOT_TOKEN не найден в переменных окружения")
         print("   Создайте файл .env и добавьте BOT_TOKEN=your_bot_token")
         sys.exit(1)
@@ -198,20 +356,25 @@ async def main():
     output_dir = "output"
     os.makedirs(output_dir, exist_ok=True)
     
+    # Пул процессов для рендеринга: параллелизм по ядрам в обход GIL
+    render_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    log_listener = _setup_logging()
+
     try:
         # Загружаем пользователей
-        users_df = load_users('users.csv')
-        
-        if users_df.empty:
+        users = load_users('users.csv')
+
+        if not users:
             print("❌ Ошибка: CSV файл пуст или не содержит данных")
             sys.exit(1)
-        
+
         # Создаем бота
-        bot = Bot(token=BOT_TOKEN)
-        
+        bot = Bot(token=bot_token)
+
         # Запускаем воронку с профилем
-        await send_funnel(bot, users_df, output_dir, send_real, args.variant, profile)
-        
+        await send_funnel(bot, users, output_dir, send_real, args.variant,
+                          profile, render_pool)
+
     except FileNotFoundError as e:
         print(f"❌ Ошибка: {e}")
         sys.exit(1)
@@ -219,6 +382,8 @@ async def main():
         print(f"❌ Неожиданная ошибка: {e}")
         sys.exit(1)
     finally:
+        render_pool.shutdown()
+        log_listener.stop()
         # Закрываем сессию бота
         if 'bot' in locals():
             await bot.session.close()
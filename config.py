@@ -1,12 +1,20 @@
 import os
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Callable
 
-# Загружаем переменные окружения
-load_dotenv()
 
-# Токен бота из переменных окружения
-BOT_TOKEN = os.getenv('BOT_TOKEN')
+def get_token() -> str:
+    """
+    Возвращает токен бота из переменных окружения.
+    .env подгружается лениво, чтобы импорт config оставался дешевым
+    для мета-команд вроде --list-profiles и --help.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    return os.getenv('BOT_TOKEN')
+
 
 # Этапы воронки
 STAGES = ['interest', 'solution', 'deadline']
@@ -17,6 +25,9 @@ VARIANTS = ['a', 'b', 'c']
 # Задержка между отправкой сообщений (секунды)
 SEND_DELAY = 1
 
+# Максимум одновременных отправок (Telegram ограничивает ~30 сообщений/сек)
+SEND_CONCURRENCY = 20
+
 # Директория с профилями
 PROFILES_DIR = Path(__file__).parent / 'profiles'
 
@@ -27,14 +38,16 @@ AVAILABLE_PROFILES = ['wellness', 'corporate', 'creative', 'luxury', 'tech', 'mi
 # ФУНКЦИИ ДЛЯ РАБОТЫ С ПРОФИЛЯМИ
 # ═══════════════════════════════════════════════════════════════════════════════
 
+@lru_cache(maxsize=None)
 def load_profile(profile_name: str = 'wellness') -> dict:
     """
     Загружает профиль брендинга из YAML файла.
-    
+    Результат кэшируется: повторные вызовы не перечитывают и не парсят YAML.
+
     Args:
         profile_name: Имя профиля (wellness, corporate, creative, luxury, tech, minimal)
                      или путь к кастомному YAML файлу
-    
+
     Returns:
         dict: Настройки профиля
     """
@@ -55,8 +68,10 @@ def load_profile(profile_name: str = 'wellness') -> dict:
         profile_path = PROFILES_DIR / 'wellness.yaml'
     
     try:
+        # CSafeLoader (LibYAML) парсит в разы быстрее чистого Python-лоадера
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         with open(profile_path, 'r', encoding='utf-8') as f:
-            profile = yaml.safe_load(f)
+            profile = yaml.load(f, Loader=loader)
         print(f"✅ Загружен профиль: {profile_path.stem}")
         return profile
     except Exception as e:
@@ -64,6 +79,18 @@ def load_profile(profile_name: str = 'wellness') -> dict:
         return get_default_profile()
 
 
+def list_available_profiles() -> list:
+    """
+    Возвращает список доступных профилей.
+    Живет в config, чтобы --list-profiles не тянул тяжелые зависимости utils.
+    iterdir + проверка суффикса: без fnmatch-регекса, который glob собирает
+    даже для тривиального шаблона.
+    """
+    if not PROFILES_DIR.exists():
+        return []
+    return sorted({p.stem for p in PROFILES_DIR.iterdir() if p.suffix == '.yaml'})
+
+
 def get_default_profile() -> dict:
     """
     Возвращает профиль по умолчанию (wellness/Poznay Sebya).
@@ -227,6 +254,51 @@ def get_cta_text(profile: dict, stage: str) -> str:
     return text
 
 
+@dataclass(frozen=True)
+class CompiledProfile:
+    """
+    Профиль с предвычисленными горячими полями.
+    Приветствие, тексты CTA и размер изображения вычисляются один раз
+    при загрузке профиля, а не на каждый рендер в цикле по пользователям.
+    """
+    raw: dict
+    greet: Callable[[str], str]
+    cta: dict
+    image_size: tuple
+
+
+def compile_profile(profile: dict) -> CompiledProfile:
+    """
+    Компилирует профиль: прошивает стиль тона в замыкание приветствия
+    и собирает тексты CTA по этапам.
+
+    Args:
+        profile: Профиль брендинга (dict из load_profile)
+
+    Returns:
+        CompiledProfile: Профиль с предвычисленными полями
+    """
+    tone = profile.get('tone', {})
+    style = tone.get('style', 'friendly')
+    greeting_template = tone.get('greetings', {}).get(style, '{{ name }}, добрый день!')
+
+    # '{{ name }}' → '{name}' один раз при компиляции: format_map идет через
+    # C-форматтер за O(длины вывода), replace сканировал бы шаблон на каждый вызов
+    compiled_greeting = greeting_template.replace('{{ name }}', '{name}')
+
+    def greet(name: str) -> str:
+        return compiled_greeting.format_map({'name': name})
+
+    cta = {stage: get_cta_text(profile, stage) for stage in STAGES}
+
+    return CompiledProfile(
+        raw=profile,
+        greet=greet,
+        cta=cta,
+        image_size=get_image_size(profile)
+    )
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # ОБРАТНАЯ СОВМЕСТИМОСТЬ
 # ═══════════════════════════════════════════════════════════════════════════════
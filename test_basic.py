@@ -3,10 +3,21 @@
 Базовый тест системы без внешних зависимостей
 """
 
+import ast
+import csv
 import os
+import re
 import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
 from pathlib import Path
 
+# Один скомпилированный regex с lookahead на каждый плейсхолдер:
+# файл сканируется за один проход вместо трех отдельных поисков.
+# Новый формат: brand.logo.text вместо brand.logo
+_MARKERS_RE = re.compile(rb'(?s)(?=.*\{\{\s*greeting\s*\}\})(?=.*\{\{\s*cta_text)(?=.*brand\.logo)')
+
 
 def test_file_structure():
     """Проверяет структуру файлов"""
@@ -25,14 +36,19 @@ def test_file_structure():
         'templates/styles.css'
     ]
     
+    # Один readdir на директорию вместо stat-syscall на каждый файл
+    present = {entry.name for entry in os.scandir('.')}
+    if Path('templates').is_dir():
+        present |= {f"templates/{entry.name}" for entry in os.scandir('templates')}
+
     all_good = True
     for file_path in required_files:
-        if Path(file_path).exists():
+        if file_path in present:
             print(f"✅ {file_path}")
         else:
             print(f"❌ {file_path} - файл не найден")
             all_good = False
-    
+
     return all_good
 
 
@@ -41,45 +57,40 @@ def test_csv_content():
     print("\n🧪 Проверяем CSV файл...")
     
     try:
-        with open('users.csv', 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        if len(lines) < 2:
+        # Один проход C-парсером csv: корректно обрабатывает запятые в кавычках,
+        # в отличие от ручного split(',')
+        with open('users.csv', 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            headers = next(reader, None)
+            rows = list(reader)
+
+        if headers is None or not rows:
             print("❌ CSV файл пуст или содержит только заголовки")
             return False
-        
-        # Проверяем заголовки
-        headers = lines[0].strip().split(',')
+
+        # Проверяем заголовки одним вычитанием множеств
         required_headers = ['name', 'role', 'company', 'telegram_id', 'variant']
-        
-        for header in required_headers:
-            if header not in headers:
-                print(f"❌ Отсутствует обязательное поле: {header}")
-                return False
-        
-        print(f"✅ CSV файл корректен: {len(lines)-1} пользователей")
+        missing_headers = set(required_headers) - set(headers)
+
+        if missing_headers:
+            print(f"❌ Отсутствуют обязательные поля: {sorted(missing_headers)}")
+            return False
+
+        print(f"✅ CSV файл корректен: {len(rows)} пользователей")
         print(f"   Поля: {', '.join(headers)}")
-        
-        # Проверяем варианты
-        variants = []
-        for line in lines[1:]:
-            parts = line.strip().split(',')
-            if len(parts) >= 5:
-                variants.append(parts[4])
-        
-        variant_counts = {}
-        for variant in variants:
-            variant_counts[variant] = variant_counts.get(variant, 0) + 1
-        
-        print(f"   Варианты: {variant_counts}")
-        
+
+        # Считаем варианты одним проходом Counter вместо ручного цикла по словарю
+        variant_counts = Counter(row[4] for row in rows if len(row) >= 5)
+
+        print(f"   Варианты: {dict(variant_counts)}")
+
         # Показываем первые несколько записей
         print("   Примеры записей:")
-        for i, line in enumerate(lines[1:4], 1):
-            print(f"   {i}. {line.strip()}")
-        
+        for i, row in enumerate(rows[:3], 1):
+            print(f"   {i}. {','.join(row)}")
+
         return True
-        
+
     except Exception as e:
         print(f"❌ Ошибка чтения CSV: {e}")
         return False
@@ -92,29 +103,27 @@ def test_html_templates():
     stages = ['interest', 'solution', 'deadline']
     variants = ['a', 'b', 'c']
     all_good = True
-    
-    for stage in stages:
-        for variant in variants:
-            template_name = f"{stage}_{variant}.html"
-            template_path = f"templates/{template_name}"
-            try:
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                
-                # Проверяем наличие основных плейсхолдеров
-                # Новый формат: brand.logo.text вместо brand.logo
-                placeholders = ['{{ greeting }}', '{{ cta_text', 'brand.logo']
-                missing_placeholders = [p for p in placeholders if p not in content]
-                
-                if missing_placeholders:
-                    print(f"⚠️  {template_name}: не найдены {missing_placeholders}")
-                else:
-                    print(f"✅ {template_name}: структура корректна")
-                    
-            except Exception as e:
-                print(f"❌ {template_name}: ошибка чтения - {e}")
-                all_good = False
-    
+
+    # Читаем все шаблоны одним проходом по директории; байтовые маркеры
+    # позволяют обойтись без UTF-8 декодирования
+    try:
+        templates = {p.stem: p.read_bytes() for p in Path('templates').glob('*.html')}
+    except Exception as e:
+        print(f"❌ Ошибка чтения шаблонов: {e}")
+        return False
+
+    for stage, variant in product(stages, variants):
+        template_name = f"{stage}_{variant}.html"
+        content = templates.get(f"{stage}_{variant}")
+
+        if content is None:
+            print(f"❌ {template_name}: файл не найден")
+            all_good = False
+        elif _MARKERS_RE.search(content):
+            print(f"✅ {template_name}: структура корректна")
+        else:
+            print(f"⚠️  {template_name}: не найдены обязательные плейсхолдеры")
+
     return all_good
 
 
@@ -142,29 +151,39 @@ def test_css_file():
         return False
 
 
+def _check_syntax(file_path):
+    """Читает файл и проверяет синтаксис. Возвращает текст ошибки или None."""
+    try:
+        content = Path(file_path).read_text(encoding='utf-8')
+
+        # ast.parse проверяет синтаксис без генерации байткода — дешевле compile
+        ast.parse(content, filename=file_path)
+        return None
+
+    except SyntaxError as e:
+        return f"синтаксическая ошибка - {e}"
+    except Exception as e:
+        return f"ошибка - {e}"
+
+
 def test_python_syntax():
     """Проверяет синтаксис Python файлов"""
     print("\n🧪 Проверяем синтаксис Python файлов...")
-    
+
     python_files = ['bot_funnel.py', 'config.py', 'utils.py']
     all_good = True
-    
-    for file_path in python_files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Простая проверка синтаксиса
-            compile(content, file_path, 'exec')
+
+    # Чтение файлов идет параллельно: IO перекрывается, сам compile быстрый
+    with ThreadPoolExecutor() as executor:
+        results = executor.map(_check_syntax, python_files)
+
+    for file_path, error in zip(python_files, results):
+        if error is None:
             print(f"✅ {file_path}: синтаксис корректен")
-            
-        except SyntaxError as e:
-            print(f"❌ {file_path}: синтаксическая ошибка - {e}")
-            all_good = False
-        except Exception as e:
-            print(f"❌ {file_path}: ошибка - {e}")
+        else:
+            print(f"❌ {file_path}: {error}")
             all_good = False
-    
+
     return all_good
 
 
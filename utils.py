@@ -1,77 +1,169 @@
-import pandas as pd
+import numpy as np
+import csv
+import hashlib
+import logging
 import os
-import tempfile
 import random
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from config import STAGES, VARIANTS, get_default_profile, get_image_size, get_greeting, get_cta_text
+from config import (
+    STAGES, VARIANTS, CompiledProfile, get_default_profile,
+    get_image_size, get_greeting, get_cta_text
+)
 
+log = logging.getLogger(__name__)
 
-def load_users(csv_path: str) -> pd.DataFrame:
+# Базовая директория проекта и Jinja2-окружение создаются один раз:
+# шаблон компилируется единожды за процесс (и кэшируется на диске между
+# запусками), повторные рендеры исполняют уже готовый код
+_BASE_DIR = Path(__file__).parent
+_TEMPLATE_DIR = _BASE_DIR / 'templates'
+_JINJA_ENV = Environment(
+    loader=FileSystemLoader(_TEMPLATE_DIR),
+    auto_reload=False,
+    cache_size=-1,
+    bytecode_cache=FileSystemBytecodeCache()
+)
+
+
+@lru_cache(maxsize=64)
+def _get_template(stage: str, variant: str):
     """
-    Загружает пользователей из CSV файла.
-    Проверяет наличие необходимых полей и конвертирует telegram_id в int.
-    Добавляет поле variant если отсутствует.
+    Возвращает скомпилированный шаблон по (stage, variant).
+    Кэширует сам объект Template: повторные рендеры минуют поиск в окружении.
+    Бросает TemplateNotFound, если шаблона нет.
+    """
+    return _JINJA_ENV.get_template(f"{stage}_{variant}.html")
+
+
+def load_users(csv_path: str) -> list:
+    """
+    Загружает пользователей из CSV файла через stdlib csv.DictReader.
+    Список пользователей помещается в память целиком, а дальше код работает
+    с одной записью за раз — pandas здесь был чистым накладным расходом
+    (импорт и DataFrame-обвязка) и убран со стартового пути бота.
+    Проверяет наличие необходимых полей, конвертирует telegram_id в int
+    и нормализует variant за один проход.
     """
     try:
-        df = pd.read_csv(csv_path)
-        
-        # Проверяем наличие необходимых полей
-        required_fields = ['name', 'role', 'company', 'telegram_id']
-        missing_fields = [field for field in required_fields if field not in df.columns]
-        
-        if missing_fields:
-            raise ValueError(f"Отсутствуют обязательные поля: {missing_fields}")
-        
-        # Добавляем поле variant если отсутствует
-        if 'variant' not in df.columns:
-            df['variant'] = 'a'
-            print("⚠️  Поле 'variant' отсутствует, установлено значение 'a' по умолчанию")
-        
-        # Конвертируем telegram_id в int
-        df['telegram_id'] = df['telegram_id'].astype(int)
-        
-        # Проверяем корректность вариантов
-        invalid_variants = df[~df['variant'].isin(VARIANTS)]
-        if not invalid_variants.empty:
-            print(f"⚠️  Найдены некорректные варианты: {invalid_variants['variant'].tolist()}")
-            df.loc[~df['variant'].isin(VARIANTS), 'variant'] = 'a'
-        
-        print(f"✅ Загружено {len(df)} пользователей из {csv_path}")
-        print(f"   Варианты: {df['variant'].value_counts().to_dict()}")
-        return df
-        
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            headers = reader.fieldnames or []
+
+            # Проверяем наличие необходимых полей
+            required_fields = ['name', 'role', 'company', 'telegram_id']
+            missing_fields = [field for field in required_fields if field not in headers]
+
+            if missing_fields:
+                raise ValueError(f"Отсутствуют обязательные поля: {missing_fields}")
+
+            if 'variant' not in headers:
+                print("⚠️  Поле 'variant' отсутствует, установлено значение 'a' по умолчанию")
+
+            users = []
+            invalid_variants = []
+            for row in reader:
+                row['telegram_id'] = int(row['telegram_id'])
+                variant = row.get('variant') or 'a'
+                if variant not in VARIANTS:
+                    invalid_variants.append(variant)
+                    variant = 'a'
+                row['variant'] = variant
+                users.append(row)
+
+        if invalid_variants:
+            print(f"⚠️  Найдены некорректные варианты: {invalid_variants}")
+
+        variant_counts = Counter(user['variant'] for user in users)
+        print(f"✅ Загружено {len(users)} пользователей из {csv_path}")
+        print(f"   Варианты: {dict(variant_counts)}")
+        return users
+
     except FileNotFoundError:
         raise FileNotFoundError(f"Файл {csv_path} не найден")
     except Exception as e:
         raise Exception(f"Ошибка при загрузке CSV: {e}")
 
 
+# Базовый контекст рендеринга по id профиля: брендинг, дизайн и контент
+# не зависят от пользователя, поэтому собираются (включая обход + stat по
+# каждому 'assets/...' пути) один раз на профиль, а не на каждый рендер
+_BASE_CTX_CACHE = {}
+
+
 def _resolve_asset_paths(data: dict, base_dir: Path) -> dict:
     """
-    Рекурсивно преобразует относительные пути к assets в абсолютные.
+    Преобразует относительные пути к assets в абсолютные.
+
+    Copy-on-write: словари без 'assets/...' значений возвращаются как есть,
+    по ссылке — копия выделяется только для веток, где путь реально
+    переписан. В типичном профиле asset-записей единицы, так что почти
+    все аллокации пропадают.
     """
-    if not isinstance(data, dict):
+    if type(data) is not dict:
         return data
-    
-    result = {}
+
+    result = data
     for key, value in data.items():
-        if isinstance(value, dict):
-            result[key] = _resolve_asset_paths(value, base_dir)
-        elif isinstance(value, str) and value.startswith('assets/'):
+        if type(value) is dict:
+            new_value = _resolve_asset_paths(value, base_dir)
+            if new_value is value:
+                continue
+        elif type(value) is str and value.startswith('assets/'):
             # Преобразуем относительный путь в абсолютный
             abs_path = base_dir / value
             if abs_path.exists():
-                result[key] = f"file://{abs_path.resolve()}"
+                new_value = f"file://{abs_path.resolve()}"
             else:
-                result[key] = value  # Оставляем как есть если файл не найден
+                continue  # Оставляем как есть если файл не найден
         else:
-            result[key] = value
-    
+            continue
+
+        if result is data:
+            result = dict(data)
+        result[key] = new_value
+
     return result
 
 
+def _profile_base_ctx(profile: dict) -> tuple:
+    """
+    Возвращает (базовый контекст рендеринга, контент по этапам) для профиля.
+    Кэшируется по id(profile); сам profile хранится в записи, чтобы dict
+    оставался жив и его id не достался другому объекту.
+    """
+    cached = _BASE_CTX_CACHE.get(id(profile))
+    if cached is not None:
+        return cached[0], cached[1]
+
+    base_ctx = {
+        # Брендинг (с абсолютными путями к assets для html2image)
+        'brand': _resolve_asset_paths(profile.get('brand', {}), _BASE_DIR),
+        'colors': profile.get('colors', {}),
+        'fonts': profile.get('fonts', {}),
+        'social': profile.get('social', {}),
+
+        # Дизайн
+        'card': profile.get('card', {}),
+        'cta': profile.get('cta', {}),
+        'image': profile.get('image', {}),
+        'banner': profile.get('banner', {}),
+        'icons': profile.get('icons', {}),
+
+        # Тон общения
+        'tone': profile.get('tone', {})
+    }
+
+    content_by_stage = profile.get('content', {})
+    _BASE_CTX_CACHE[id(profile)] = (base_ctx, content_by_stage, profile)
+    return base_ctx, content_by_stage
+
+
 def render_html(stage: str, variant: str, user_data: dict, profile: dict = None) -> str:
     """
     Рендерит HTML шаблон с данными пользователя, брендингом и профилем.
@@ -80,70 +172,48 @@ def render_html(stage: str, variant: str, user_data: dict, profile: dict = None)
         stage: Этап воронки (interest, solution, deadline)
         variant: Вариант A/B-теста (a, b, c)
         user_data: Данные пользователя (name, role, company)
-        profile: Профиль брендинга (если None, используется default)
-    
+        profile: Профиль брендинга (dict или CompiledProfile; None — default)
+
     Returns:
         str: Отрендеренный HTML
     """
-    if profile is None:
+    compiled = profile if isinstance(profile, CompiledProfile) else None
+    if compiled is not None:
+        profile = compiled.raw
+    elif profile is None:
         profile = get_default_profile()
     
     try:
-        # Базовая директория проекта
-        base_dir = Path(__file__).parent
-        
-        # Создаем Jinja2 окружение
-        template_dir = base_dir / 'templates'
-        env = Environment(loader=FileSystemLoader(template_dir))
-        
-        # Формируем имя шаблона
-        template_name = f"{stage}_{variant}.html"
-        template_path = template_dir / template_name
-        
-        if not template_path.exists():
-            raise FileNotFoundError(f"Шаблон {template_name} не найден")
-        
-        # Загружаем шаблон
-        template = env.get_template(template_name)
+        # Загружаем шаблон из кэша (отсутствие — TemplateNotFound, без stat)
+        template = _get_template(stage, variant)
         
         # Получаем приветствие и CTA на основе профиля
-        greeting = get_greeting(profile, user_data.get('name', 'User'))
-        cta_text = get_cta_text(profile, stage)
-        
-        # Преобразуем пути к assets в абсолютные для html2image
-        brand_data = _resolve_asset_paths(profile.get('brand', {}), base_dir)
+        # (для CompiledProfile — из предвычисленных полей)
+        if compiled is not None:
+            greeting = compiled.greet(user_data.get('name', 'User'))
+            cta_text = compiled.cta.get(stage) or get_cta_text(profile, stage)
+        else:
+            greeting = get_greeting(profile, user_data.get('name', 'User'))
+            cta_text = get_cta_text(profile, stage)
         
-        # Подготавливаем данные для рендеринга
+        # Постоянная часть контекста (брендинг, дизайн, контент по этапам)
+        # собирается один раз на профиль и переиспользуется между рендерами
+        base_ctx, content_by_stage = _profile_base_ctx(profile)
+
+        # Подготавливаем данные для рендеринга: к базовому контексту
+        # добавляются только данные конкретного пользователя и этапа
         render_data = {
-            # Данные пользователя
+            **base_ctx,
             **user_data,
-            
-            # Брендинг (с абсолютными путями)
-            'brand': brand_data,
-            'colors': profile.get('colors', {}),
-            'fonts': profile.get('fonts', {}),
-            'social': profile.get('social', {}),
-            
-            # Дизайн
-            'card': profile.get('card', {}),
-            'cta': profile.get('cta', {}),
-            'image': profile.get('image', {}),
-            'banner': profile.get('banner', {}),
-            'icons': profile.get('icons', {}),
-            
-            # Контент
-            'content': profile.get('content', {}).get(stage, {}),
-            'tone': profile.get('tone', {}),
-            
-            # Вспомогательные
+            'content': content_by_stage.get(stage, {}),
             'greeting': greeting,
             'cta_text': cta_text,
             'stage': stage,
             'variant': variant
         }
-        
+
         # Рендерим с данными пользователя и брендингом
-        html_content = template.render(**render_data)
+        html_content = template.render(render_data)
         
         return html_content
         
@@ -151,11 +221,166 @@ def render_html(stage: str, variant: str, user_data: dict, profile: dict = None)
         raise Exception(f"Ошибка при рендеринге HTML {stage}_{variant}: {e}")
 
 
-def html_to_png(html_str: str, stage: str, user_id: int, output_dir: str, 
+# Ленивая инициализация Playwright: один постоянный Chromium на процесс
+# вместо запуска нового headless-браузера на каждый баннер
+_PLAYWRIGHT = None
+_PW_BROWSER = None
+_PW_FAILED = False
+
+# Один Html2Image на процесс: конструктор каждый раз заново ищет бинарник
+# Chrome и собирает флаги. Обертка не потокобезопасна, поэтому синглтон
+# под замком; параллельный рендер идет через процессы, не через потоки.
+_HTI = None
+_HTI_LOCK = threading.Lock()
+
+
+def _get_hti(output_dir: str, size: tuple):
+    """
+    Возвращает общий экземпляр Html2Image, обновляя директорию вывода
+    и размер под текущий вызов.
+    """
+    global _HTI
+    from html2image import Html2Image
+
+    with _HTI_LOCK:
+        if _HTI is None:
+            _HTI = Html2Image(
+                output_path=output_dir,
+                size=size,
+                custom_flags=['--no-sandbox', '--disable-gpu', '--hide-scrollbars']
+            )
+        else:
+            _HTI.output_path = output_dir
+            _HTI.size = size
+        return _HTI
+
+
+def _screenshot_playwright(html_str: str, png_path: str, width: int, height: int) -> bool:
+    """
+    Рендерит HTML в PNG через постоянный Chromium (Playwright).
+
+    Returns:
+        bool: True при успехе, False если Playwright недоступен
+    """
+    global _PLAYWRIGHT, _PW_BROWSER, _PW_FAILED
+
+    if _PW_FAILED:
+        return False
+
+    try:
+        if _PW_BROWSER is None:
+            from playwright.sync_api import sync_playwright
+            _PLAYWRIGHT = sync_playwright().start()
+            _PW_BROWSER = _PLAYWRIGHT.chromium.launch(
+                args=['--no-sandbox', '--disable-gpu', '--hide-scrollbars']
+            )
+
+        page = _PW_BROWSER.new_page(viewport={'width': width, 'height': height})
+        try:
+            page.set_content(html_str, wait_until='domcontentloaded')
+            page.screenshot(path=png_path)
+        finally:
+            page.close()
+        return True
+
+    except Exception as e:
+        # Не установлен или не смог запуститься — больше не пробуем
+        _PW_FAILED = True
+        log.warning(f"   ⚠️  Playwright недоступен ({e}), используем html2image")
+        return False
+
+
+# Фоновые изображения по (stage, variant): тяжелый браузерный рендер
+# выполняется один раз на пару шаблон×вариант, персональный текст дальше
+# наносится Pillow. N пользователей = 9 рендеров браузером + N дешевых
+# наложений текста вместо N браузерных рендеров.
+_BG_CACHE = {}
+
+
+def _render_background_html(stage: str, variant: str, profile: dict) -> str:
+    """
+    Рендерит HTML шаблона с пустыми персональными полями — общий фон
+    для всех пользователей данной пары (stage, variant).
+    """
+    template = _get_template(stage, variant)
+    base_ctx, content_by_stage = _profile_base_ctx(profile)
+    return template.render({
+        **base_ctx,
+        'name': '', 'role': '', 'company': '',
+        'content': content_by_stage.get(stage, {}),
+        'greeting': '', 'cta_text': '',
+        'stage': stage,
+        'variant': variant
+    })
+
+
+def _composite_banner(stage: str, variant: str, output_dir: str,
+                      greeting: str, cta_text: str, profile: dict,
+                      png_path: str, width: int, height: int) -> bool:
+    """
+    Собирает баннер из закэшированного фона и персонального текста.
+
+    Внимание: координаты текста фиксированные (отступ card.padding от
+    краев) — шаблоны должны оставлять эти зоны под персонализацию.
+
+    Returns:
+        bool: True при успехе, False если фон отрендерить не удалось
+    """
+    from PIL import Image, ImageDraw
+
+    key = (stage, variant)
+    background = _BG_CACHE.get(key)
+    if background is None:
+        bg_filename = f"_bg_{stage}_{variant}.png"
+        bg_path = os.path.join(output_dir, bg_filename)
+        html_bg = _render_background_html(stage, variant, profile)
+
+        if not _screenshot_playwright(html_bg, bg_path, width, height):
+            try:
+                hti = _get_hti(output_dir, (width, height))
+                hti.screenshot(html_str=html_bg, save_as=bg_filename)
+            except Exception:
+                return False
+
+        if not os.path.exists(bg_path):
+            return False
+
+        background = Image.open(bg_path).convert('RGB')
+        _BG_CACHE[key] = background
+
+    colors = profile.get('colors', {})
+    fonts_config = profile.get('fonts', {})
+    padding = profile.get('card', {}).get('padding', 40)
+
+    img = background.copy()
+    draw = ImageDraw.Draw(img)
+
+    greeting_font = _get_font(_FONT_PATH, fonts_config.get('size_subtitle', 24))
+    cta_font = _get_font(_FONT_PATH, fonts_config.get('size_button', 16))
+
+    draw.text((padding, padding), greeting,
+              fill=_hex_to_rgb(colors.get('text_primary', '#333333')),
+              font=greeting_font)
+    draw.text((padding, height - padding - fonts_config.get('size_button', 16)),
+              cta_text,
+              fill=_hex_to_rgb(colors.get('button_text', '#FFFFFF')),
+              font=cta_font)
+
+    img.save(png_path)
+    return True
+
+
+def html_to_png(html_str: str, stage: str, user_id: int, output_dir: str,
                 user_data: dict = None, profile: dict = None) -> str:
     """
-    Конвертирует HTML в PNG изображение через браузерный рендеринг.
-    
+    Конвертирует HTML в PNG изображение.
+
+    Бэкенд выбирается переменной окружения RENDER_BACKEND:
+    - 'pillow' (по умолчанию) — чистый Pillow-рендер без браузера:
+      нет запуска процессов и DOM-верстки, сотни мс на баннер экономии
+    - 'html' — браузерный рендеринг (Playwright → html2image → Pillow)
+      для попиксельной точности HTML-шаблонов
+
     Args:
         html_str: HTML-контент (полностью отрендеренный)
         stage: Этап воронки
@@ -163,10 +388,12 @@ def html_to_png(html_str: str, stage: str, user_id: int, output_dir: str,
         output_dir: Директория для сохранения
         user_data: Данные пользователя
         profile: Профиль брендинга
-    
+
     Returns:
         str: Путь к сгенерированному PNG
     """
+    if isinstance(profile, CompiledProfile):
+        profile = profile.raw
     if profile is None:
         profile = get_default_profile()
     
@@ -179,61 +406,185 @@ def html_to_png(html_str: str, stage: str, user_id: int, output_dir: str,
         
         # Получаем размеры изображения из профиля
         width, height = get_image_size(profile)
-        
-        # Имя файла
-        png_filename = f"{stage}_{user_id}.png"
+
+        # Контентно-адресуемое имя: хэш отрендеренного HTML однозначно
+        # определяет картинку, повторные запуски с теми же шаблонами и
+        # данными обходятся одним stat вместо рендера
+        content_hash = hashlib.blake2b(html_str.encode('utf-8'),
+                                       digest_size=8).hexdigest()
+        png_filename = f"{stage}_{content_hash}.png"
         png_path = os.path.join(output_dir, png_filename)
-        
-        # Пробуем html2image (браузерный рендеринг)
+
+        if os.path.exists(png_path):
+            log.info(f"   ♻️  Используем готовый: {png_filename}")
+            return png_path
+
+        # Основной (production) бэкенд — Pillow: браузер нужен только при
+        # явном RENDER_BACKEND=html
+        if os.getenv('RENDER_BACKEND', 'pillow') != 'html':
+            return _pillow_fallback(html_str, stage, user_id, output_dir,
+                                    user_data, profile, png_filename)
+
+        # Опциональный композитный путь (RENDER_COMPOSITE=1): фон пары
+        # (stage, variant) рендерится браузером один раз, дальше только текст
+        if os.getenv('RENDER_COMPOSITE') == '1':
+            # stage приходит с суффиксом варианта ('interest_b') —
+            # разбираем его так же, как _pillow_fallback
+            stage_base, _, variant = stage.partition('_')
+            variant = variant or 'a'
+            greeting = get_greeting(profile, user_data.get('name', 'User'))
+            cta_text = get_cta_text(profile, stage_base)
+            try:
+                composed = _composite_banner(stage_base, variant, output_dir,
+                                             greeting, cta_text, profile,
+                                             png_path, width, height)
+            except Exception as e:
+                # Фон не отрендерился (нет шаблона, браузер упал) —
+                # баннер пойдет обычным браузерным путем
+                log.warning(f"   ⚠️  Композитный рендер не удался ({e}), используем браузер")
+                composed = False
+            if composed:
+                log.info(f"   📸 Сгенерировано (композит): {png_filename} ({width}x{height})")
+                return png_path
+
+        # Основной путь: постоянный Chromium через Playwright — без
+        # запуска нового процесса браузера на каждый баннер
+        if _screenshot_playwright(html_str, png_path, width, height):
+            log.info(f"   📸 Сгенерировано (Playwright): {png_filename} ({width}x{height})")
+            return png_path
+
+        # Fallback: html2image (запускает браузер на каждый вызов)
         try:
-            from html2image import Html2Image
-            
-            # Создаём временную директорию для html2image
-            temp_output = tempfile.mkdtemp()
-            
-            hti = Html2Image(
-                output_path=temp_output,
-                size=(width, height),
-                custom_flags=['--no-sandbox', '--disable-gpu', '--hide-scrollbars']
-            )
-            
+            hti = _get_hti(output_dir, (width, height))
+
             # Рендерим HTML в PNG
             hti.screenshot(
                 html_str=html_str,
                 save_as=png_filename
             )
-            
-            # Перемещаем файл в output_dir
-            temp_png = os.path.join(temp_output, png_filename)
-            if os.path.exists(temp_png):
-                import shutil
-                shutil.move(temp_png, png_path)
-                
-                # Очищаем временную директорию
-                shutil.rmtree(temp_output, ignore_errors=True)
-                
-                print(f"   📸 Сгенерировано: {png_filename} ({width}x{height})")
+
+            if os.path.exists(png_path):
+                log.info(f"   📸 Сгенерировано: {png_filename} ({width}x{height})")
                 return png_path
             else:
                 raise Exception("html2image не создал файл")
-                
+
         except ImportError:
-            print("   ⚠️  html2image не установлен, используем Pillow fallback")
-            return _pillow_fallback(html_str, stage, user_id, output_dir, user_data, profile)
+            log.warning("   ⚠️  html2image не установлен, используем Pillow fallback")
+            return _pillow_fallback(html_str, stage, user_id, output_dir,
+                                    user_data, profile, png_filename)
         except Exception as e:
-            print(f"   ⚠️  html2image ошибка: {e}, используем Pillow fallback")
-            return _pillow_fallback(html_str, stage, user_id, output_dir, user_data, profile)
+            log.warning(f"   ⚠️  html2image ошибка: {e}, используем Pillow fallback")
+            return _pillow_fallback(html_str, stage, user_id, output_dir,
+                                    user_data, profile, png_filename)
             
     except Exception as e:
         raise Exception(f"Ошибка при конвертации HTML в PNG: {e}")
 
 
+def _render_banner_task(user: dict, stage: str, variant: str,
+                        output_dir: str, profile: dict) -> str:
+    """
+    Задача воркера: рендер одного баннера (выполняется в отдельном процессе,
+    Jinja-окружение и браузер у каждого процесса свои).
+    """
+    user_data = {
+        'name': user['name'],
+        'role': user['role'],
+        'company': user['company']
+    }
+    html_content = render_html(stage, variant, user_data, profile)
+    return html_to_png(html_content, f"{stage}_{variant}", user['telegram_id'],
+                       output_dir, user_data, profile)
+
+
+def render_banners_batch(users: list, stage: str, profile: dict = None,
+                         output_dir: str = 'output', workers: int = None) -> dict:
+    """
+    Пакетный рендер баннеров этапа для списка пользователей в пуле процессов.
+    Рендеры независимы, поэтому масштабируются почти линейно по ядрам
+    (Pillow-путь CPU-bound; браузерный путь перекрывает IO).
+
+    Args:
+        users: Список пользователей (dict как из load_users)
+        stage: Этап воронки
+        profile: Профиль брендинга
+        output_dir: Директория для PNG
+        workers: Количество процессов (по умолчанию os.cpu_count())
+
+    Returns:
+        dict: telegram_id -> путь к PNG
+    """
+    if isinstance(profile, CompiledProfile):
+        profile = profile.raw
+    if workers is None:
+        workers = os.cpu_count()
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_render_banner_task, user, stage,
+                            user.get('variant', 'a'), output_dir, profile):
+            user['telegram_id']
+            for user in users
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    return results
+
+
+def _find_font() -> str:
+    """
+    Находит первый доступный TTF-шрифт на хосте (macOS/Linux/Windows).
+    Пробуется один раз при импорте модуля — только stat, без загрузки PIL.
+    """
+    candidates = [
+        '/System/Library/Fonts/Helvetica.ttc',
+        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+        'C:/Windows/Fonts/arial.ttf',
+    ]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+    return ''
+
+
+_FONT_PATH = _find_font()
+
+
+@lru_cache(maxsize=64)
+def _get_font(path: str, size: int):
+    """
+    Возвращает шрифт по (path, size). Объекты ImageFont иммутабельны,
+    поэтому кэшируются: без чтения и парсинга файла на каждый баннер.
+    """
+    from PIL import ImageFont
+
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=128)
+def _text_length(text: str, font) -> float:
+    """
+    Ширина текста в пикселях. Тексты CTA повторяются между баннерами,
+    а шрифты — синглтоны из _get_font, так что замер делается один раз
+    на уникальную пару (текст, шрифт).
+    """
+    return font.getlength(text)
+
+
 def _pillow_fallback(html_str: str, stage: str, user_id: int, output_dir: str,
-                     user_data: dict, profile: dict) -> str:
+                     user_data: dict, profile: dict, png_filename: str = None) -> str:
     """
     Fallback генерация через Pillow если html2image недоступен.
     """
-    from PIL import Image, ImageDraw, ImageFont
+    from PIL import Image, ImageDraw
     
     width, height = get_image_size(profile)
     colors = profile.get('colors', {})
@@ -244,33 +595,22 @@ def _pillow_fallback(html_str: str, stage: str, user_id: int, output_dir: str,
     text_color = colors.get('text_primary', '#4A4F46')
     accent_color = colors.get('secondary', '#A38DA2')
     
-    # Создаём изображение с градиентом
-    img = Image.new('RGB', (width, height))
+    # Вертикальный градиент одним NumPy-броадкастом: пара C-ufunc вместо
+    # draw.line на каждую из height строк
+    bg1 = np.array(_hex_to_rgb(colors.get('background', '#F5F3EF')), dtype=np.float32)
+    bg2 = np.array(_hex_to_rgb(colors.get('background_alt', '#E3D6C4')), dtype=np.float32)
+
+    ratio = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    rows = (bg1 * (1 - ratio) + bg2 * ratio).astype(np.uint8)
+    gradient = np.broadcast_to(rows[:, None, :], (height, width, 3)).copy()
+
+    img = Image.fromarray(gradient, 'RGB')
     draw = ImageDraw.Draw(img)
     
-    # Простой вертикальный градиент
-    bg1 = _hex_to_rgb(colors.get('background', '#F5F3EF'))
-    bg2 = _hex_to_rgb(colors.get('background_alt', '#E3D6C4'))
-    
-    for y in range(height):
-        ratio = y / height
-        r = int(bg1[0] * (1 - ratio) + bg2[0] * ratio)
-        g = int(bg1[1] * (1 - ratio) + bg2[1] * ratio)
-        b = int(bg1[2] * (1 - ratio) + bg2[2] * ratio)
-        draw.line([(0, y), (width, y)], fill=(r, g, b))
-    
-    # Загружаем шрифты
-    try:
-        font_large = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 
-                                        fonts_config.get('size_title', 42))
-        font_medium = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 
-                                         fonts_config.get('size_subtitle', 26))
-        font_small = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", 
-                                        fonts_config.get('size_body', 18))
-    except:
-        font_large = ImageFont.load_default()
-        font_medium = font_large
-        font_small = font_large
+    # Загружаем шрифты из кэша (разбор TTF — один раз на размер)
+    font_large = _get_font(_FONT_PATH, fonts_config.get('size_title', 42))
+    font_medium = _get_font(_FONT_PATH, fonts_config.get('size_subtitle', 26))
+    font_small = _get_font(_FONT_PATH, fonts_config.get('size_body', 18))
     
     padding = profile.get('card', {}).get('padding', 48)
     stage_base = stage.split('_')[0] if '_' in stage else stage
@@ -318,9 +658,10 @@ def _pillow_fallback(html_str: str, stage: str, user_id: int, output_dir: str,
     cta_text = get_cta_text(profile, stage_base)
     cta_y = height - padding - 70
     
-    # Кнопка CTA (прямоугольник)
+    # Кнопка CTA (прямоугольник): ширина по реальной метрике текста,
+    # а не по количеству символов — кнопка плотнее и без повторных замеров
     button_color = _hex_to_rgb(colors.get('button_bg', '#8CA29B'))
-    button_width = len(cta_text) * 12 + 60
+    button_width = int(_text_length(cta_text, font_small)) + 60
     draw.rounded_rectangle(
         [(padding, cta_y), (padding + button_width, cta_y + 50)],
         radius=25,
@@ -333,20 +674,26 @@ def _pillow_fallback(html_str: str, stage: str, user_id: int, output_dir: str,
     draw.text((padding, height - padding - 10), tagline, fill=text_color, font=font_small)
     
     # Сохраняем
-    png_filename = f"{stage}_{user_id}.png"
+    if png_filename is None:
+        png_filename = f"{stage}_{user_id}.png"
     png_path = os.path.join(output_dir, png_filename)
     
-    quality = profile.get('image', {}).get('quality', 95)
-    img.save(png_path, quality=quality)
-    
-    print(f"   📸 Сгенерировано (Pillow): {png_filename}")
+    # Быстрое PNG-кодирование: optimize перебирает фильтры ради единиц
+    # процентов размера, а Telegram все равно пережимает картинку
+    img.save(png_path, format='PNG', optimize=False, compress_level=1)
+
+    log.info(f"   📸 Сгенерировано (Pillow): {png_filename}")
     return png_path
 
 
+@lru_cache(maxsize=256)
 def _hex_to_rgb(hex_color: str) -> tuple:
-    """Конвертирует HEX цвет в RGB tuple."""
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    """
+    Конвертирует HEX цвет в RGB tuple.
+    Палитра профиля повторяется от баннера к баннеру — каждый уникальный
+    цвет парсится один раз, а сам парсинг идет через C-реализацию fromhex.
+    """
+    return tuple(bytes.fromhex(hex_color.lstrip('#')))
 
 
 def get_keyboard(stage: str, user_id: int, user_name: str = None, profile: dict = None) -> InlineKeyboardMarkup:
@@ -362,12 +709,18 @@ def get_keyboard(stage: str, user_id: int, user_name: str = None, profile: dict
     Returns:
         InlineKeyboardMarkup: Клавиатура с кнопкой
     """
-    if profile is None:
+    compiled = profile if isinstance(profile, CompiledProfile) else None
+    if compiled is not None:
+        profile = compiled.raw
+    elif profile is None:
         profile = get_default_profile()
-    
+
     # Получаем текст кнопки из профиля
     stage_base = stage.split('_')[0] if '_' in stage else stage
-    button_text = get_cta_text(profile, stage_base)
+    if compiled is not None:
+        button_text = compiled.cta.get(stage_base) or get_cta_text(profile, stage_base)
+    else:
+        button_text = get_cta_text(profile, stage_base)
     
     # Добавляем имя пользователя если есть
     if user_name:
@@ -384,34 +737,114 @@ def get_keyboard(stage: str, user_id: int, user_name: str = None, profile: dict
     return keyboard
 
 
+# Кортеж вместо списка: неизменяемый и чуть дешевле при индексации
+_VARIANTS_TUPLE = tuple(VARIANTS)
+
+
+def get_random_variants(n: int) -> list:
+    """
+    Возвращает n случайных вариантов для A/B-тестирования одним вызовом —
+    при пакетном назначении вариантов это один проход по генератору
+    вместо n отдельных вызовов random.choice.
+    """
+    return random.choices(_VARIANTS_TUPLE, k=n)
+
+
 def get_random_variant() -> str:
     """
     Возвращает случайный вариант для A/B-тестирования.
     """
-    return random.choice(VARIANTS)
+    return get_random_variants(1)[0]
 
 
 def list_available_profiles() -> list:
     """
     Возвращает список доступных профилей.
     """
-    from config import PROFILES_DIR, AVAILABLE_PROFILES
-    
-    profiles = []
-    if PROFILES_DIR.exists():
-        for file in PROFILES_DIR.glob('*.yaml'):
-            profiles.append(file.stem)
-    
-    return sorted(set(profiles))
+    from config import list_available_profiles as _list_profiles
+    return _list_profiles()
+
+
+# Pydantic-модель профиля собирается лениво и один раз: pydantic-core
+# проходит структуру в Rust за один вызов вместо десятков проверок
+# вхождения по словарям в интерпретаторе
+_PROFILE_MODEL = None
+_PYDANTIC_FAILED = False
+
+
+def _get_profile_model():
+    """
+    Возвращает pydantic-модель профиля или None, если pydantic недоступен.
+    """
+    global _PROFILE_MODEL, _PYDANTIC_FAILED
+    if _PROFILE_MODEL is not None or _PYDANTIC_FAILED:
+        return _PROFILE_MODEL
+
+    try:
+        from pydantic import BaseModel, ConfigDict
+    except ImportError:
+        _PYDANTIC_FAILED = True
+        return None
+
+    from typing import Any
+
+    class _Brand(BaseModel):
+        model_config = ConfigDict(extra='allow')
+        name: Any
+        logo: Any
+
+    class _Colors(BaseModel):
+        model_config = ConfigDict(extra='allow')
+        primary: Any
+        background: Any
+        text_primary: Any
+
+    class _Content(BaseModel):
+        model_config = ConfigDict(extra='allow')
+        interest: Any
+        solution: Any
+        deadline: Any
+
+    class _Profile(BaseModel):
+        model_config = ConfigDict(extra='allow')
+        brand: _Brand
+        colors: _Colors
+        fonts: Any
+        image: Any
+        cta: Any
+        tone: Any
+        content: _Content
+
+    _PROFILE_MODEL = _Profile
+    return _PROFILE_MODEL
 
 
 def validate_profile(profile: dict) -> tuple:
     """
     Проверяет корректность профиля.
-    
+
+    Основной путь — pydantic (один проход по структуре в pydantic-core);
+    без pydantic используются ручные проверки по словарям.
+
     Returns:
         tuple: (is_valid: bool, errors: list)
     """
+    model = _get_profile_model()
+    if model is not None:
+        from pydantic import ValidationError
+        try:
+            model.model_validate(profile)
+            return (True, [])
+        except ValidationError as e:
+            errors = []
+            for err in e.errors():
+                path = '.'.join(str(part) for part in err['loc'])
+                if err['type'] == 'missing':
+                    errors.append(f"Отсутствует поле: {path}")
+                else:
+                    errors.append(f"{path}: {err['msg']}")
+            return (False, errors)
+
     errors = []
     required_sections = ['brand', 'colors', 'fonts', 'image', 'cta', 'tone', 'content']
     